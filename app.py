@@ -1,11 +1,13 @@
-from flask import Flask, render_template, request, send_file, jsonify, send_from_directory
+from flask import Flask, render_template, request, send_file, jsonify, send_from_directory, g
 from werkzeug.utils import secure_filename
 import os
 import json
 import tempfile
 import zipfile
 import shutil
-from typetrim import process_font_file  # 导入 TrimType 字体裁剪功能
+import profiling  # 慢任务性能剖析
+import chunked_upload  # 大文件分片上传
+import font_executor  # 并发模式下的字体处理进程池
 import logging
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -32,9 +34,22 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"]
 )
 
+# 分片上传单独计数，不与页面访问共用默认限制；按批量处理大字体的需要设置
+# （同时进行的上传数量另有 UPLOAD_MAX_OPEN 限制，见 chunked_upload.py）
+UPLOAD_INIT_LIMIT = os.environ.get('UPLOAD_INIT_LIMIT', '200 per hour')
+
+# 为每个请求分配请求 ID，便于与日志和性能剖析留档对应
+# 请求 ID 始终由服务端生成；客户端传入的 X-Request-ID 只作为关联信息记录，不用作留档文件名
+@app.before_request
+def assign_request_id():
+    g.request_id = uuid.uuid4().hex
+    g.client_request_id = request.headers.get('X-Request-ID', '')[:128] or None
+
 # 添加安全头
 @app.after_request
 def add_security_headers(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
     response.headers['X-Frame-Options'] = 'DENY'  # 防止点击劫持
     response.headers['X-Content-Type-Options'] = 'nosniff'  # 防止内容类型嗅探
     response.headers['X-XSS-Protection'] = '1; mode=block'  # XSS 保护
@@ -113,6 +128,58 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'ttf', 'otf', 'woff', 'woff2', 'eot', 'ttc'}
 
+def process_saved_font(input_path, original_filename, options):
+    """处理已保存到磁盘的字体文件并返回响应，处理完成后删除输入文件"""
+    try:
+        # 使用 TrimType 处理字体
+        logging.debug(f"开始处理字体文件: {input_path} (请求 ID: {g.request_id})")
+        result = font_executor.run_font_job(
+            profiling.profiled_process_font_file,
+            input_path, options,
+            request_id=g.request_id,
+            client_request_id=g.client_request_id,
+            profile=profiling.should_profile(request.headers),
+            filename=original_filename
+        )
+        
+        # 检查处理后的文件大小
+        if os.path.getsize(result['output_path']) < 1024:  # 小于1KB
+            raise Exception("处理后的文件大小异常，可能处理失败，请检查字体文件是否有效")
+        
+        logging.debug(f"字体处理结果: {result}")
+        
+        # 清理输入临时文件
+        os.unlink(input_path)
+        
+        # 添加下载链接到结果
+        result['download_url'] = f"/download/{os.path.basename(result['output_path'])}?original_name={original_filename}"
+        result['filename'] = original_filename
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        error_msg = str(e)
+        error_type = type(e).__name__
+        import traceback
+        stack_trace = traceback.format_exc()
+        logging.error(f"字体处理错误: {error_msg}")
+        logging.error(f"错误类型: {error_type}")
+        logging.error(f"错误堆栈: {stack_trace}")
+        
+        # 清理临时文件
+        try:
+            os.unlink(input_path)
+            if 'result' in locals() and 'output_path' in result:
+                os.unlink(result['output_path'])
+        except:
+            pass
+            
+        # 翻译错误消息为用户友好的中文
+        friendly_error = translate_error_message(error_msg)
+        return jsonify({
+            'error': friendly_error
+        }), 500
+
 @app.route('/process', methods=['POST'])
 @limiter.exempt  # 明确豁免速率限制，允许批量处理
 def process_font():
@@ -151,48 +218,7 @@ def process_font():
             font_file.save(input_temp.name)
             input_path = input_temp.name
             
-        try:
-            # 使用 TrimType 处理字体
-            logging.debug(f"开始处理字体文件: {input_path}")
-            result = process_font_file(input_path, options)
-            
-            # 检查处理后的文件大小
-            if os.path.getsize(result['output_path']) < 1024:  # 小于1KB
-                raise Exception("处理后的文件大小异常，可能处理失败，请检查字体文件是否有效")
-            
-            logging.debug(f"字体处理结果: {result}")
-            
-            # 清理输入临时文件
-            os.unlink(input_path)
-            
-            # 添加下载链接到结果
-            result['download_url'] = f"/download/{os.path.basename(result['output_path'])}?original_name={original_filename}"
-            result['filename'] = original_filename
-            
-            return jsonify(result)
-            
-        except Exception as e:
-            error_msg = str(e)
-            error_type = type(e).__name__
-            import traceback
-            stack_trace = traceback.format_exc()
-            logging.error(f"字体处理错误: {error_msg}")
-            logging.error(f"错误类型: {error_type}")
-            logging.error(f"错误堆栈: {stack_trace}")
-            
-            # 清理临时文件
-            try:
-                os.unlink(input_path)
-                if 'result' in locals() and 'output_path' in result:
-                    os.unlink(result['output_path'])
-            except:
-                pass
-                
-            # 翻译错误消息为用户友好的中文
-            friendly_error = translate_error_message(error_msg)
-            return jsonify({
-                'error': friendly_error
-            }), 500
+        return process_saved_font(input_path, original_filename, options)
         
     except Exception as e:
         error_msg = str(e)
@@ -216,6 +242,82 @@ def process_font():
             'error': friendly_error
         }), 500
 
+def upload_error_response(error):
+    """把分片上传错误转换为 JSON 响应"""
+    body = {'error': str(error)}
+    if getattr(error, 'missing', None):
+        body['missing'] = error.missing
+    if str(error).startswith('文件超过100MB'):
+        body['suggest_download_local'] = True
+        body['download_local_url'] = '/download/local'
+    return jsonify(body), error.status
+
+@app.route('/upload/init', methods=['POST'])
+@limiter.limit(UPLOAD_INIT_LIMIT)
+def upload_init():
+    """创建分片上传任务"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    if not filename:
+        return jsonify({'error': '未选择字体文件'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的字体格式'}), 400
+
+    try:
+        meta = chunked_upload.create_upload(filename, data.get('size'), data.get('chunk_size'))
+    except chunked_upload.UploadError as e:
+        return upload_error_response(e)
+    meta['received'] = []
+    return jsonify(meta)
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+@limiter.exempt  # 只能访问已创建的上传任务，创建本身已受限制
+def upload_status(upload_id):
+    """查询上传任务状态，用于断点续传"""
+    try:
+        return jsonify(chunked_upload.get_upload(upload_id))
+    except chunked_upload.UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/upload/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@limiter.exempt  # 一个文件会有多个分片，分片请求不计入访问限制
+def upload_chunk(upload_id, index):
+    """上传一个分片，请求体为分片原始数据，X-Chunk-SHA256 为其校验值"""
+    try:
+        stored = chunked_upload.write_chunk(
+            upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256', ''))
+    except chunked_upload.UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        # 多为客户端中途断开，该分片未被标记为已接收，可以重新上传
+        logging.warning(f"分片写入失败: {upload_id}/{index}: {e}")
+        return jsonify({'error': '分片上传中断，请重试'}), 400
+    return jsonify({'index': index, 'duplicate': not stored})
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+@limiter.exempt  # 与 /process 一样允许批量处理，每个上传任务只能 finalize 一次
+def upload_finalize(upload_id):
+    """所有分片到齐后合并并处理字体"""
+    try:
+        meta, input_path = chunked_upload.finalize_upload(upload_id)
+    except chunked_upload.UploadError as e:
+        return upload_error_response(e)
+
+    data = request.get_json(silent=True) or {}
+    options = data.get('options') or {}
+    logging.debug(f"分片上传完成: {meta['filename']}，接收到的选项: {options}")
+    return process_saved_font(input_path, meta['filename'], options)
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+@limiter.exempt
+def upload_cancel(upload_id):
+    """取消上传任务"""
+    try:
+        chunked_upload.delete_upload(upload_id)
+    except chunked_upload.UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True})
+
 @app.route('/download/<path:filename>', methods=['GET'])
 def download(filename):
     try:
@@ -248,6 +350,30 @@ def download(filename):
         friendly_error = translate_error_message(str(e))
         return jsonify({'error': friendly_error}), 500
 
+@app.route('/admin/profiles', methods=['GET'])
+@limiter.exempt
+def list_profiles():
+    """列出已保存的性能剖析留档（需要管理员令牌）"""
+    if not profiling.is_admin_request(request.headers):
+        return jsonify({'error': '未找到页面'}), 404
+    return jsonify({'profiles': profiling.list_profiles()})
+
+@app.route('/admin/profiles/<request_id>/<kind>', methods=['GET'])
+@limiter.exempt
+def download_profile(request_id, kind):
+    """下载某个请求的留档文件，kind 为 json / prof / stacks"""
+    if not profiling.is_admin_request(request.headers):
+        return jsonify({'error': '未找到页面'}), 404
+    path = profiling.artifact_paths(request_id).get(kind)
+    if not path:
+        return jsonify({'error': '留档不存在或已过期'}), 404
+    return send_file(
+        path,
+        as_attachment=True,
+        mimetype='application/json' if kind == 'json' else 'application/octet-stream',
+        download_name=os.path.basename(path)
+    )
+
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(
@@ -268,6 +394,11 @@ def create_local_package():
             'app.py',
             'wsgi.py',
             'typetrim.py',
+            'profiling.py',
+            'chunked_upload.py',
+            'font_executor.py',
+            'warmup.py',
+            'native_thread.py',
             'requirements.txt',
             'README.md',
             'USER_GUIDE.md',
@@ -0,0 +1,96 @@
+"""
+启动性能基准
+-----------------------------------
+分别在全新的 Python 进程中测量：
+
+- 导入 app 的耗时
+- 推迟到首次剖析时才导入的模块（cProfile / pstats / tracemalloc）的耗时，即推迟导入为启动节省的时间
+- 第一次 /process 的耗时（未预热，相当于普通 worker 的第一个请求）
+- 预热后第一次 /process 的耗时（相当于 gunicorn.conf.py 预加载 + 预热后 fork 出的 worker）
+
+用法：python bench_startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 在子进程中执行，保证每次测量都是冷启动
+CHILD_SCRIPT = r'''
+import json, logging, os, sys, time
+logging.disable(logging.CRITICAL)
+warm = sys.argv[1] == '1'
+font_path = sys.argv[2]
+
+start = time.perf_counter()
+import app
+import_time = time.perf_counter() - start
+
+# profiling.py 中只在完整剖析时才导入的模块，测量推迟导入节省的时间
+start = time.perf_counter()
+import cProfile, pstats, tracemalloc
+deferred_time = time.perf_counter() - start
+
+from warmup import warm_up
+warmup_time = warm_up() if warm else 0.0
+
+client = app.app.test_client()
+
+def post():
+    with open(font_path, 'rb') as f:
+        start = time.perf_counter()
+        response = client.post('/process', data={
+            'font': (f, 'sample.ttf'),
+            'options': json.dumps({'latin': True, 'numbers': True}),
+        })
+        elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.get_data(as_text=True)
+    os.unlink(response.get_json()['output_path'])
+    return elapsed
+
+first = post()
+second = post()
+print(json.dumps({'import': import_time, 'deferred': deferred_time, 'warmup': warmup_time,
+                  'first': first, 'second': second}))
+'''
+
+
+def run_child(warm, font_path):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, '1' if warm else '0', font_path],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TrimType 启动性能基准')
+    parser.add_argument('--runs', type=int, default=5, help='每种模式的重复次数（默认 5）')
+    args = parser.parse_args()
+
+    # 测试字体在父进程中生成，避免生成过程本身预热子进程中的 fontTools
+    from warmup import build_sample_font
+    fd, font_path = tempfile.mkstemp(suffix='.ttf')
+    os.close(fd)
+    build_sample_font(font_path)
+
+    print(f"启动性能基准（每种模式 {args.runs} 次，取中位数，单位 ms）")
+    print(f"{'模式':<10}{'导入 app':>12}{'推迟的导入':>12}{'预热':>12}{'首个请求':>12}{'第二个请求':>12}")
+    try:
+        for label, warm in (('未预热', False), ('预热', True)):
+            samples = [run_child(warm, font_path) for _ in range(args.runs)]
+            median = {key: statistics.median(s[key] for s in samples) * 1000 for key in samples[0]}
+            print(f"{label:<10}{median['import']:>12.1f}{median['deferred']:>12.1f}{median['warmup']:>12.1f}"
+                  f"{median['first']:>12.1f}{median['second']:>12.1f}")
+    finally:
+        os.unlink(font_path)
+
+
+if __name__ == '__main__':
+    main()
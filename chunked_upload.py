@@ -0,0 +1,267 @@
+"""
+TrimType 分片上传
+-----------------------------------
+大字体文件在网络不稳定时整体上传容易失败，这里提供可断点续传的分片上传：
+
+1. init：登记文件名和大小，在磁盘上预分配数据文件
+2. 逐个上传分片（可并发、可重复），每个分片附带 SHA-256 校验值，
+   校验通过后直接写入数据文件的对应偏移位置，并留下已接收标记
+3. finalize：所有分片到齐后交给字体处理流程
+
+上传状态全部保存在磁盘上（不依赖进程内存），多个 gunicorn worker 之间可以共享；
+未完成的上传数量和总大小有上限，超过有效期未完成的上传会在之后的上传请求中被清理。
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+# 分片上传的临时目录
+UPLOAD_ROOT = os.environ.get('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'typetrim-uploads'))
+
+# 默认分片大小及允许的范围
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 10 * 1024 * 1024
+
+# 文件大小限制，与 /process 保持一致
+MIN_FILE_SIZE = 1024
+MAX_FILE_SIZE = 100 * 1024 * 1024
+
+# 未完成的上传超过该时间（秒）没有新的分片即被清理
+UPLOAD_EXPIRE_SECONDS = int(os.environ.get('UPLOAD_EXPIRE_SECONDS', 30 * 60))
+
+# 除 init 外，其他上传请求也会顺带清理过期的上传，每个进程两次清理之间至少间隔该秒数
+CLEANUP_INTERVAL = 60
+_last_cleanup = 0
+
+# 同时存在的未完成上传数量及其总大小上限，防止磁盘被占满
+UPLOAD_MAX_OPEN = int(os.environ.get('UPLOAD_MAX_OPEN', 20))
+UPLOAD_MAX_TOTAL_BYTES = int(os.environ.get('UPLOAD_MAX_TOTAL_BYTES', 1024 * 1024 * 1024))
+
+# 写入分片时每次读取的字节数
+_COPY_BLOCK_SIZE = 64 * 1024
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """分片上传错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _upload_dir(upload_id):
+    if not upload_id or not _UPLOAD_ID_RE.match(upload_id):
+        raise UploadError('上传任务不存在或已过期', 404)
+    return os.path.join(UPLOAD_ROOT, upload_id)
+
+
+def _data_path(upload_id):
+    return os.path.join(_upload_dir(upload_id), 'data')
+
+
+def _chunk_marker(upload_id, index):
+    return os.path.join(_upload_dir(upload_id), 'chunks', str(index))
+
+
+def create_upload(filename, size, chunk_size=None):
+    """创建上传任务，返回任务信息"""
+    if not isinstance(size, int) or size < MIN_FILE_SIZE:
+        raise UploadError('文件大小异常，可能不是有效的字体文件')
+    if size > MAX_FILE_SIZE:
+        raise UploadError('文件超过100MB限制')
+
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if not isinstance(chunk_size, int) or not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError('分片大小无效')
+
+    # 先清理过期的上传，再检查剩余的上传是否已达上限
+    cleanup_stale_uploads()
+    open_uploads = _open_uploads()
+    if len(open_uploads) >= UPLOAD_MAX_OPEN:
+        raise UploadError('服务器繁忙，当前上传任务过多，请稍后重试', 503)
+    if sum(meta.get('size', 0) for meta in open_uploads) + size > UPLOAD_MAX_TOTAL_BYTES:
+        raise UploadError('服务器繁忙，当前上传任务过多，请稍后重试', 503)
+
+    upload_id = uuid.uuid4().hex
+    upload_dir = _upload_dir(upload_id)
+    os.makedirs(os.path.join(upload_dir, 'chunks'))
+
+    # 预分配数据文件，各分片直接写入各自的偏移位置
+    with open(_data_path(upload_id), 'wb') as f:
+        f.truncate(size)
+
+    meta = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'size': size,
+        'chunk_size': chunk_size,
+        'total_chunks': math.ceil(size / chunk_size),
+        'created_at': time.time(),
+    }
+    with open(os.path.join(upload_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    logging.debug(f"创建分片上传任务: {meta}")
+    return meta
+
+
+def _open_uploads():
+    """返回所有未完成上传的任务信息（按声明的文件大小预留磁盘空间）"""
+    try:
+        upload_ids = os.listdir(UPLOAD_ROOT)
+    except OSError:
+        return []
+
+    uploads = []
+    for upload_id in upload_ids:
+        if not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        try:
+            with open(os.path.join(UPLOAD_ROOT, upload_id, 'meta.json'), encoding='utf-8') as f:
+                uploads.append(json.load(f))
+        except (OSError, ValueError):
+            # 刚创建还未写入 meta.json 的任务，按最大文件大小计算
+            uploads.append({'upload_id': upload_id, 'size': MAX_FILE_SIZE})
+    return uploads
+
+
+def get_upload(upload_id):
+    """读取上传任务信息，附带已接收的分片列表"""
+    cleanup_stale_uploads_if_due()
+    try:
+        with open(os.path.join(_upload_dir(upload_id), 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise UploadError('上传任务不存在或已过期', 404)
+    meta['received'] = received_chunks(upload_id)
+    return meta
+
+
+def received_chunks(upload_id):
+    """返回已接收（校验通过）的分片序号"""
+    try:
+        names = os.listdir(os.path.join(_upload_dir(upload_id), 'chunks'))
+    except OSError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def write_chunk(upload_id, index, stream, checksum):
+    """把一个分片从请求流写入数据文件
+
+    分片边读边写，不在内存中缓存整个分片。已接收过的分片直接忽略，返回 False；
+    写入并校验成功返回 True。校验失败时该分片不会被标记为已接收，可以重新上传。
+    """
+    meta = get_upload(upload_id)
+    if not isinstance(index, int) or not 0 <= index < meta['total_chunks']:
+        raise UploadError('分片序号无效')
+    if not checksum or not re.match(r'^[0-9a-fA-F]{64}$', checksum):
+        raise UploadError('缺少分片校验值')
+
+    if index in meta['received']:
+        return False
+
+    offset = index * meta['chunk_size']
+    expected_length = min(meta['chunk_size'], meta['size'] - offset)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(_data_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        while True:
+            block = stream.read(min(_COPY_BLOCK_SIZE, expected_length + 1 - written))
+            if not block:
+                break
+            written += len(block)
+            if written > expected_length:
+                raise UploadError('分片大小与预期不一致')
+            digest.update(block)
+            f.write(block)
+
+    if written != expected_length:
+        raise UploadError('分片大小与预期不一致')
+    if digest.hexdigest() != checksum.lower():
+        raise UploadError('分片校验失败，请重新上传该分片')
+
+    # 数据写入完成后再打标记，标记存在即表示该分片可用
+    with open(_chunk_marker(upload_id, index), 'w') as f:
+        f.write(checksum.lower())
+    return True
+
+
+def finalize_upload(upload_id):
+    """确认所有分片到齐，返回 (任务信息, 完整文件路径)
+
+    完整文件会被移动到上传目录之外（保留原始扩展名），调用方负责在处理后删除；
+    上传目录随即删除。重复调用时只有第一次成功。
+    """
+    meta = get_upload(upload_id)
+    missing = sorted(set(range(meta['total_chunks'])) - set(meta['received']))
+    if missing:
+        error = UploadError('分片尚未上传完整', 409)
+        error.missing = missing
+        raise error
+
+    fd, font_path = tempfile.mkstemp(suffix=os.path.splitext(meta['filename'])[1])
+    os.close(fd)
+    try:
+        os.replace(_data_path(upload_id), font_path)
+    except FileNotFoundError:
+        os.unlink(font_path)
+        raise UploadError('该上传任务已在处理中', 409)
+
+    delete_upload(upload_id)
+    return meta, font_path
+
+
+def delete_upload(upload_id):
+    """删除上传任务及其临时文件"""
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+
+
+def cleanup_stale_uploads_if_due():
+    """距上次清理超过 CLEANUP_INTERVAL 秒时清理过期的上传，返回清理的数量"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL:
+        return 0
+    _last_cleanup = now
+    return cleanup_stale_uploads()
+
+
+def cleanup_stale_uploads(max_age=None):
+    """清理超过有效期未完成的上传，返回清理的数量"""
+    max_age = UPLOAD_EXPIRE_SECONDS if max_age is None else max_age
+    try:
+        upload_ids = os.listdir(UPLOAD_ROOT)
+    except OSError:
+        return 0
+
+    now = time.time()
+    removed = 0
+    for upload_id in upload_ids:
+        upload_dir = os.path.join(UPLOAD_ROOT, upload_id)
+        if not _UPLOAD_ID_RE.match(upload_id) or not os.path.isdir(upload_dir):
+            continue
+        try:
+            # 每收到一个分片，chunks 目录的修改时间都会更新
+            last_active = max(os.path.getmtime(upload_dir),
+                              os.path.getmtime(os.path.join(upload_dir, 'chunks')))
+        except OSError:
+            last_active = 0
+        if now - last_active > max_age:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            removed += 1
+    if removed:
+        logging.info(f"已清理 {removed} 个过期的分片上传")
+    return removed
@@ -13,18 +13,13 @@ echo "========================================="
 # 检查 gunicorn 是否安装
 if command -v gunicorn &> /dev/null; then
     echo "使用 Gunicorn 启动服务..."
-    # Gunicorn 配置
-    # -w: worker 进程数（根据 CPU 核心数调整）
-    # -b: 绑定地址和端口
-    # --timeout: 超时时间（字体处理可能需要较长时间）
-    # --access-logfile: 访问日志
-    # --error-logfile: 错误日志
-    exec gunicorn -w 2 -b 0.0.0.0:${PORT:-8080} \
-        --timeout 300 \
-        --access-logfile - \
-        --error-logfile - \
-        --log-level info \
-        wsgi:app
+    # Gunicorn 配置见 gunicorn.conf.py（通过环境变量调整）
+    # PORT: 监听端口
+    # WEB_CONCURRENCY: worker 进程数（根据 CPU 核心数调整）
+    # GUNICORN_TIMEOUT: 超时时间（字体处理可能需要较长时间）
+    # TYPETRIM_SERVER_MODE=concurrent: gevent worker + 字体处理进程池，慢速客户端不会占满 worker
+    # 应用在 master 中预加载并预热 fontTools 后再 fork worker，加快冷启动
+    exec gunicorn -c gunicorn.conf.py wsgi:app
 else
     echo "使用 Flask 内置服务器启动..."
     # 如果 gunicorn 不可用，使用 Flask 内置服务器
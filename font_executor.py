@@ -0,0 +1,181 @@
+"""
+TrimType 字体处理进程池
+-----------------------------------
+并发模式下（gunicorn gevent worker，见 gunicorn.conf.py），网络读写由协程并发处理，
+而 CPU 密集的字体裁剪放到独立的进程池中执行，避免阻塞事件循环、拖慢其他请求。
+
+进程池大小默认按 CPU 核数在各个 gunicorn worker 之间均分；
+单个任务从在子进程中开始执行起超过 TYPETRIM_JOB_TIMEOUT（默认同 GUNICORN_TIMEOUT）会被中止，
+在队列中等待的时间不计入超时，同一进程池中的其他任务不受影响。
+未开启时（TYPETRIM_EXECUTOR 不为 process）直接在当前线程中执行，与原来的行为一致。
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import native_thread
+
+# 任务超时后仍未中止（例如卡在不响应信号的 C 扩展中）时，再等待该秒数由看门狗结束子进程
+HARD_TIMEOUT_GRACE = 10
+
+_executor = None
+_max_workers = None  # 首次启动时确定，进程池重建时沿用
+_executor_lock = threading.Lock()
+
+
+def executor_enabled():
+    """是否使用进程池执行字体处理"""
+    return os.environ.get('TYPETRIM_EXECUTOR', '') == 'process'
+
+
+def get_cpu_workers(web_workers=1):
+    """进程池大小：TYPETRIM_CPU_WORKERS，默认为 CPU 核数 / gunicorn worker 数"""
+    configured = int(os.environ.get('TYPETRIM_CPU_WORKERS', 0))
+    if configured > 0:
+        return configured
+    return max(1, (os.cpu_count() or 1) // max(1, web_workers))
+
+
+def get_job_timeout():
+    """单个字体处理任务的超时秒数：TYPETRIM_JOB_TIMEOUT，默认同 GUNICORN_TIMEOUT（300）"""
+    return float(os.environ.get('TYPETRIM_JOB_TIMEOUT') or os.environ.get('GUNICORN_TIMEOUT') or 300)
+
+
+def _ping():
+    return os.getpid()
+
+
+class JobTimeout(BaseException):
+    """子进程中的任务超时
+
+    继承 BaseException，避免被字体处理代码中的 except Exception 捕获后改写成普通错误。
+    """
+
+
+# 以下状态只在进程池的子进程中使用
+_job_deadline = None  # 当前任务的强制结束时间（time.monotonic）
+_watchdog_started = False
+
+
+def _on_job_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def _watchdog():
+    """子进程中的看门狗：任务超时后仍未中止，直接结束子进程"""
+    while True:
+        native_thread.sleep(0.5)
+        deadline = _job_deadline
+        if deadline is not None and time.monotonic() > deadline:
+            logging.error(f"字体处理进程 {os.getpid()} 超时后仍未中止，强制退出")
+            os._exit(1)
+
+
+def _run_job(timeout, grace, func, args, kwargs):
+    """在子进程中执行任务，超时从任务开始执行时计算
+
+    超时时通过 SIGALRM 在任务中抛出 JobTimeout，子进程本身继续为后续任务服务；
+    只有任务不响应信号时才由看门狗结束子进程。
+    看门狗必须是原生线程：子进程 fork 自 gevent worker，协程在任务执行期间得不到调度。
+    """
+    global _job_deadline, _watchdog_started
+    if not _watchdog_started:
+        native_thread.start_new_thread(_watchdog)
+        _watchdog_started = True
+
+    previous_handler = signal.signal(signal.SIGALRM, _on_job_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    _job_deadline = time.monotonic() + timeout + grace
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        _job_deadline = None
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _create_executor(max_workers):
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+    # ProcessPoolExecutor 在第一次提交任务时才创建子进程，这里提前触发
+    pids = {future.result() for future in [executor.submit(_ping) for _ in range(max_workers)]}
+    logging.info(f"字体处理进程池已启动，进程数: {max_workers}，PID: {sorted(pids)}")
+    return executor
+
+
+def start_executor(max_workers=None):
+    """创建进程池并立即启动全部子进程（已存在则直接返回）
+
+    子进程以 fork 方式创建，直接继承当前进程中已预加载、已预热的 fontTools
+    （见 gunicorn.conf.py），无需重新导入。应在 worker 处理请求之前调用
+    （gunicorn.conf.py 的 post_worker_init），此时 worker 中还没有其他线程。
+
+    _executor_lock 在 gevent patch 之前创建，是会阻塞整个 worker 的原生锁，
+    因此只在读写 _executor 时持有；等待子进程启动在锁外进行。
+    多个协程同时重建时各自创建进程池，只保留先完成的一个。
+    """
+    global _executor, _max_workers
+    with _executor_lock:
+        if _executor is not None:
+            return _executor
+        _max_workers = max_workers or _max_workers or get_cpu_workers()
+        size = _max_workers
+
+    executor = _create_executor(size)
+    with _executor_lock:
+        if _executor is None:
+            _executor = executor
+        current = _executor
+    if current is not executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return current
+
+
+def shutdown_executor():
+    """关闭进程池"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _reset_executor(executor):
+    """丢弃已损坏的进程池并重建；多个请求同时发现同一个进程池损坏时只重建一次"""
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _executor = None
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    start_executor()
+
+
+def run_font_job(func, *args, **kwargs):
+    """执行字体处理任务：开启进程池时提交到进程池并等待结果，否则直接调用
+
+    func 及其参数需要可以被 pickle（模块级函数）。任务超时只中止该任务本身；
+    子进程异常退出导致进程池损坏时重建进程池，失败的任务在新进程池中重试一次。
+    """
+    if not executor_enabled():
+        return func(*args, **kwargs)
+
+    timeout = get_job_timeout()
+    for attempt in range(2):
+        executor = start_executor()
+        try:
+            return executor.submit(_run_job, timeout, HARD_TIMEOUT_GRACE, func, args, kwargs).result()
+        except JobTimeout:
+            logging.error(f"字体处理超过 {timeout:g} 秒未完成，已中止")
+            raise Exception("字体处理超时，可能是字体文件过大或已损坏")
+        except BrokenProcessPool:
+            # 子进程异常退出（例如内存不足被系统杀掉，或超时后被看门狗结束）
+            logging.error("字体处理进程异常退出，正在重建进程池")
+            _reset_executor(executor)
+    raise Exception("字体处理失败：处理进程异常退出，可能是字体文件过大或已损坏")
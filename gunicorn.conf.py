@@ -0,0 +1,70 @@
+# Gunicorn 配置（生产环境）
+#
+# 启动方式：gunicorn -c gunicorn.conf.py wsgi:app
+#
+# 应用在 master 进程中预加载，并在 fork 之前用内置小字体预热 fontTools，
+# 这样各个 worker 启动时无需重复导入，第一次 /process 也不会额外变慢，
+# 预热后的内存页由各 worker 以写时复制的方式共享。
+#
+# 可用环境变量：
+#   PORT               监听端口（默认 8080）
+#   WEB_CONCURRENCY    worker 进程数（默认 2）
+#   GUNICORN_TIMEOUT   请求超时秒数（默认 300，字体处理可能较慢）
+#   TYPETRIM_PRELOAD   是否在 master 中预加载应用（默认 1）
+#   TYPETRIM_WARMUP    是否在 fork 前预热 fontTools（默认 1，仅在预加载时生效）
+#   TYPETRIM_SERVER_MODE
+#                      sync（默认）：同步 worker，一个请求占用一个 worker 进程
+#                      concurrent：gevent worker + 字体处理进程池，慢速上传/下载只占用一个协程，
+#                                  字体裁剪在进程池中执行（见 font_executor.py）
+#   GUNICORN_WORKER_CONNECTIONS
+#                      concurrent 模式下每个 worker 的最大并发连接数（默认 1000）
+#   TYPETRIM_CPU_WORKERS
+#                      concurrent 模式下每个 worker 的字体处理进程数（默认 CPU 核数 / WEB_CONCURRENCY）
+#   TYPETRIM_JOB_TIMEOUT
+#                      concurrent 模式下单个字体处理任务的超时秒数（默认同 GUNICORN_TIMEOUT）
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+preload_app = os.environ.get('TYPETRIM_PRELOAD', '1') == '1'
+
+server_mode = os.environ.get('TYPETRIM_SERVER_MODE', 'sync')
+if server_mode == 'concurrent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+    # worker 中通过环境变量得知需要使用进程池
+    os.environ['TYPETRIM_EXECUTOR'] = 'process'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """master 就绪后、fork worker 之前执行"""
+    if not preload_app:
+        return
+    if os.environ.get('TYPETRIM_WARMUP', '1') == '1':
+        from warmup import warm_up
+        elapsed = warm_up()
+        server.log.info(f"fontTools 预热完成，耗时 {elapsed * 1000:.1f}ms")
+    # 把预加载的对象移出 GC 跟踪范围，避免 worker 中的垃圾回收写这些内存页、破坏写时复制
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """worker 初始化完成、开始处理请求之前创建字体处理进程池
+
+    子进程从 worker fork 出来，继承预加载和预热后的内存，第一个请求无需等待子进程启动。
+    """
+    import font_executor
+    if font_executor.executor_enabled():
+        font_executor.start_executor(font_executor.get_cpu_workers(worker.cfg.workers))
+
+
+def worker_exit(server, worker):
+    import font_executor
+    font_executor.shutdown_executor()
@@ -0,0 +1,41 @@
+"""
+TrimType 原生线程工具
+-----------------------------------
+并发模式下 gunicorn 使用 gevent worker，threading / time.sleep 等会被 monkey patch 成协程版本；
+字体处理进程池的子进程从 worker fork 而来，同样处于 patch 之后的状态。
+
+协程在 CPU 密集的字体裁剪期间得不到调度，因此栈采样、超时看门狗这类
+需要与主线程并行运行的逻辑必须使用未被 patch 的原生线程和原生线程 ID。
+未安装或未启用 gevent 时，这里的函数就是标准库中的对应函数。
+"""
+
+import importlib
+
+
+def _original(module_name, name):
+    """返回未被 gevent patch 的原始函数"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return getattr(importlib.import_module(module_name), name)
+    return monkey.get_original(module_name, name)
+
+
+def get_ident():
+    """当前原生线程的 ID（与 sys._current_frames() 的键一致）"""
+    return _original('_thread', 'get_ident')()
+
+
+def start_new_thread(function, args=()):
+    """启动一个原生线程"""
+    return _original('_thread', 'start_new_thread')(function, args)
+
+
+def allocate_lock():
+    """创建一个原生锁"""
+    return _original('_thread', 'allocate_lock')()
+
+
+def sleep(seconds):
+    """阻塞当前原生线程，不切换协程"""
+    _original('time', 'sleep')(seconds)
@@ -0,0 +1,286 @@
+"""
+TrimType 字体任务性能剖析
+-----------------------------------
+按需对 process_font_file 进行性能剖析，便于排查线上的慢任务：
+
+- 管理员请求头（X-Profile-Token）或按采样率开启完整剖析（cProfile + tracemalloc）
+- 超过耗时阈值的任务自动留档（低开销的栈采样）
+- 剖析结果按请求 ID 保存为留档文件，可通过管理接口列出和下载
+"""
+
+import hmac
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import native_thread
+from typetrim import process_font_file
+
+# 管理员请求头，值需与 PROFILE_ADMIN_TOKEN 一致
+PROFILE_HEADER = 'X-Profile-Token'
+
+# 请求 ID 只允许字母数字及 - _，避免被拼接成任意路径
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def get_profile_settings():
+    """读取剖析相关配置（均来自环境变量）"""
+    return {
+        # 管理员令牌，未设置时不允许通过请求头开启剖析，管理接口也不可用
+        'admin_token': os.environ.get('PROFILE_ADMIN_TOKEN', ''),
+        # 随机采样比例（0~1），0 表示不采样
+        'sample_rate': float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        # 超过该耗时（秒）的任务自动留档，0 表示关闭
+        'slow_threshold': float(os.environ.get('PROFILE_SLOW_THRESHOLD', 30)),
+        # 留档目录
+        'profile_dir': os.environ.get('PROFILE_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'typetrim-profiles')),
+        # 最多保留的留档数量，超出后删除最旧的
+        'max_artifacts': int(os.environ.get('PROFILE_MAX_ARTIFACTS', 50)),
+        # tracemalloc 输出的分配位置数量
+        'top_allocations': int(os.environ.get('PROFILE_TOP_ALLOCATIONS', 25)),
+    }
+
+
+def is_valid_request_id(request_id):
+    """检查请求 ID 是否可以安全地用作文件名"""
+    return bool(request_id) and bool(_REQUEST_ID_RE.match(request_id))
+
+
+def is_admin_request(headers, settings=None):
+    """请求头中的令牌是否与管理员令牌一致"""
+    settings = settings or get_profile_settings()
+    token = settings['admin_token']
+    # 使用常数时间比较，避免通过响应时间逐字节猜测令牌
+    return bool(token) and hmac.compare_digest(headers.get(PROFILE_HEADER, '').encode(), token.encode())
+
+
+def should_profile(headers, settings=None):
+    """判断本次请求是否需要完整剖析"""
+    settings = settings or get_profile_settings()
+    if is_admin_request(headers, settings):
+        return True
+    return settings['sample_rate'] > 0 and random.random() < settings['sample_rate']
+
+
+def get_font_table_sizes(font_path):
+    """读取字体文件中各个表的大小（字节），读取失败时返回空字典"""
+    from fontTools.ttLib import TTFont
+    try:
+        # 只读取表目录，不解析表内容；TTC 默认取第 0 个子字体，与 process_font_file 一致
+        font = TTFont(font_path, lazy=True, fontNumber=0)
+        try:
+            return {tag: entry.length for tag, entry in sorted(font.reader.tables.items())}
+        finally:
+            font.close()
+    except Exception as e:
+        logging.warning(f"读取字体表大小失败: {e}")
+        return {}
+
+
+class StackSampler:
+    """低开销的栈采样器：在后台线程中定期记录目标线程的调用栈
+
+    用于所有任务的慢任务留档——cProfile 开销太大，不适合默认开启。
+    采样线程和线程 ID 都使用原生线程（见 native_thread.py），在 gevent patch 之后的进程中同样有效。
+    """
+
+    def __init__(self, thread_id=None, interval=0.01, max_depth=40):
+        self.thread_id = thread_id or native_thread.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._running = False
+        self._finished = native_thread.allocate_lock()
+
+    def start(self):
+        self._running = True
+        self._finished.acquire()
+        native_thread.start_new_thread(self._run)
+
+    def stop(self):
+        self._running = False
+        # 等待采样线程退出
+        self._finished.acquire()
+        self._finished.release()
+
+    def _run(self):
+        try:
+            while self._running:
+                native_thread.sleep(self.interval)
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+        finally:
+            self._finished.release()
+
+    def collapsed(self):
+        """以 collapsed stack 格式（可直接用于火焰图工具）返回采样结果"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _save_artifact(settings, request_id, metadata, profiler=None, sampler=None):
+    """保存留档文件：<id>.json 为摘要，<id>.prof 为 cProfile 数据，<id>.stacks 为采样栈"""
+    import pstats
+    profile_dir = settings['profile_dir']
+    os.makedirs(profile_dir, exist_ok=True)
+
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(profile_dir, f"{request_id}.prof"))
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+        metadata['profile_summary'] = stream.getvalue()
+    if sampler is not None:
+        with open(os.path.join(profile_dir, f"{request_id}.stacks"), 'w', encoding='utf-8') as f:
+            f.write(sampler.collapsed())
+        metadata['samples'] = sum(sampler.stacks.values())
+
+    with open(os.path.join(profile_dir, f"{request_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    _prune_artifacts(settings)
+    logging.info(f"已保存性能剖析留档: {request_id} ({metadata['reason']})")
+
+
+def _prune_artifacts(settings):
+    """超出数量上限时删除最旧的留档"""
+    profiles = list_profiles(settings)
+    for stale in profiles[settings['max_artifacts']:]:
+        for path in artifact_paths(stale['request_id'], settings).values():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def profiled_process_font_file(input_path, options=None, request_id=None, profile=False,
+                               filename=None, settings=None, client_request_id=None):
+    """带性能剖析的 process_font_file
+
+    profile 为 True 时使用 cProfile + tracemalloc 完整剖析并保存留档；
+    否则仅做栈采样，任务耗时超过阈值时才保存留档。
+    剖析本身出错不会影响字体处理结果。
+
+    request_id 用作留档文件名，必须由服务端生成；客户端传入的请求 ID
+    通过 client_request_id 只记录在摘要中。
+    """
+    settings = settings or get_profile_settings()
+    slow_threshold = settings['slow_threshold']
+    if not is_valid_request_id(request_id) or (not profile and slow_threshold <= 0):
+        return process_font_file(input_path, options)
+
+    profiler = None
+    sampler = None
+    started_tracemalloc = False
+    if profile:
+        # cProfile / tracemalloc 只在完整剖析时才需要，推迟导入（节省的时间见 bench_startup.py）
+        import cProfile
+        import tracemalloc
+        profiler = cProfile.Profile()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+    else:
+        sampler = StackSampler()
+        sampler.start()
+
+    start = time.perf_counter()
+    error = None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        return process_font_file(input_path, options)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        duration = time.perf_counter() - start
+
+        try:
+            reason = 'requested' if profile else ('slow' if duration >= slow_threshold else None)
+            if reason:
+                metadata = {
+                    'request_id': request_id,
+                    'client_request_id': client_request_id,
+                    'reason': reason,
+                    'filename': filename or os.path.basename(input_path),
+                    'options': options or {},
+                    'duration': round(duration, 3),
+                    'created_at': time.time(),
+                    'error': error,
+                    'input_size': os.path.getsize(input_path) if os.path.exists(input_path) else None,
+                    'table_sizes': get_font_table_sizes(input_path),
+                }
+                if profiler is not None:
+                    snapshot = tracemalloc.take_snapshot()
+                    metadata['top_allocations'] = [
+                        str(stat) for stat in snapshot.statistics('lineno')[:settings['top_allocations']]
+                    ]
+                    metadata['peak_traced_memory'] = tracemalloc.get_traced_memory()[1]
+                _save_artifact(settings, request_id, metadata, profiler, sampler)
+        except Exception as e:
+            logging.error(f"保存性能剖析留档失败: {e}")
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+
+def artifact_paths(request_id, settings=None):
+    """返回某个请求已存在的留档文件，键为文件类型（json/prof/stacks）"""
+    settings = settings or get_profile_settings()
+    if not is_valid_request_id(request_id):
+        return {}
+    paths = {}
+    for kind in ('json', 'prof', 'stacks'):
+        path = os.path.join(settings['profile_dir'], f"{request_id}.{kind}")
+        if os.path.exists(path):
+            paths[kind] = path
+    return paths
+
+
+def list_profiles(settings=None):
+    """列出所有留档的摘要信息，按时间从新到旧排序"""
+    settings = settings or get_profile_settings()
+    profile_dir = settings['profile_dir']
+    if not os.path.isdir(profile_dir):
+        return []
+
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(profile_dir, name), encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        request_id = metadata.get('request_id', '')
+        profiles.append({
+            'request_id': request_id,
+            'client_request_id': metadata.get('client_request_id'),
+            'reason': metadata.get('reason'),
+            'filename': metadata.get('filename'),
+            'duration': metadata.get('duration'),
+            'created_at': metadata.get('created_at'),
+            'error': metadata.get('error'),
+            'artifacts': sorted(artifact_paths(request_id, settings)),
+        })
+    profiles.sort(key=lambda p: p.get('created_at') or 0, reverse=True)
+    return profiles
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+import chunked_upload
+from app import app
+from warmup import build_sample_font
+
+CHUNK_SIZE = 1024
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_ROOT', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(chunked_upload, 'MIN_CHUNK_SIZE', CHUNK_SIZE)
+    return app.test_client()
+
+
+@pytest.fixture
+def font_data(tmp_path):
+    with open(build_sample_font(str(tmp_path / 'sample.ttf')), 'rb') as f:
+        return f.read()
+
+
+def init_upload(client, font_data):
+    response = client.post('/upload/init', json={
+        'filename': 'sample.ttf', 'size': len(font_data), 'chunk_size': CHUNK_SIZE})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def put_chunk(client, upload_id, font_data, index, checksum=None):
+    chunk = font_data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+    return client.put(f'/upload/{upload_id}/chunks/{index}', data=chunk, headers={
+        'X-Chunk-SHA256': checksum or hashlib.sha256(chunk).hexdigest()})
+
+
+def test_chunked_upload_out_of_order_and_resume(client, font_data):
+    meta = init_upload(client, font_data)
+    upload_id = meta['upload_id']
+    total = meta['total_chunks']
+    assert total == -(-len(font_data) // CHUNK_SIZE)
+
+    # 乱序上传一部分，模拟中途断开
+    for index in reversed(range(1, total)):
+        assert put_chunk(client, upload_id, font_data, index).status_code == 200
+
+    # 未到齐时不能完成
+    response = client.post(f'/upload/{upload_id}/finalize', json={'options': {'latin': True}})
+    assert response.status_code == 409
+    assert response.get_json()['missing'] == [0]
+
+    # 查询状态后续传剩余分片
+    status = client.get(f'/upload/{upload_id}').get_json()
+    assert status['received'] == list(range(1, total))
+    assert put_chunk(client, upload_id, font_data, 0).status_code == 200
+
+    response = client.post(f'/upload/{upload_id}/finalize', json={'options': {'latin': True}})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['filename'] == 'sample.ttf'
+    os.unlink(result['output_path'])
+
+    # 完成后上传任务即被删除
+    assert client.get(f'/upload/{upload_id}').status_code == 404
+
+
+def test_duplicate_chunk_is_ignored(client, font_data):
+    upload_id = init_upload(client, font_data)['upload_id']
+    assert put_chunk(client, upload_id, font_data, 0).get_json()['duplicate'] is False
+    assert put_chunk(client, upload_id, font_data, 0).get_json()['duplicate'] is True
+
+
+def test_bad_checksum_is_rejected(client, font_data):
+    upload_id = init_upload(client, font_data)['upload_id']
+    response = put_chunk(client, upload_id, font_data, 0, checksum='0' * 64)
+    assert response.status_code == 400
+    assert client.get(f'/upload/{upload_id}').get_json()['received'] == []
+
+
+def test_init_validation(client):
+    response = client.post('/upload/init', json={'filename': 'a.txt', 'size': 4096})
+    assert response.status_code == 400
+    response = client.post('/upload/init', json={'filename': 'a.ttf', 'size': 200 * 1024 * 1024})
+    assert response.status_code == 400
+    assert response.get_json()['suggest_download_local'] is True
+    assert client.get('/upload/../../etc').status_code == 404
+
+
+def test_stale_uploads_are_cleaned(client, font_data):
+    upload_id = init_upload(client, font_data)['upload_id']
+    upload_dir = os.path.join(chunked_upload.UPLOAD_ROOT, upload_id)
+    old = time.time() - chunked_upload.UPLOAD_EXPIRE_SECONDS - 10
+    os.utime(upload_dir, (old, old))
+    os.utime(os.path.join(upload_dir, 'chunks'), (old, old))
+
+    assert chunked_upload.cleanup_stale_uploads() == 1
+    assert not os.path.exists(upload_dir)
+
+
+def test_stale_uploads_are_cleaned_by_other_upload_requests(client, font_data, monkeypatch):
+    stale_id = init_upload(client, font_data)['upload_id']
+    upload_id = init_upload(client, font_data)['upload_id']
+    stale_dir = os.path.join(chunked_upload.UPLOAD_ROOT, stale_id)
+    old = time.time() - chunked_upload.UPLOAD_EXPIRE_SECONDS - 10
+    os.utime(stale_dir, (old, old))
+    os.utime(os.path.join(stale_dir, 'chunks'), (old, old))
+
+    # 查询其他上传的状态时顺带清理，但受清理间隔限制
+    monkeypatch.setattr(chunked_upload, '_last_cleanup', time.time())
+    assert client.get(f'/upload/{upload_id}').status_code == 200
+    assert os.path.exists(stale_dir)
+
+    monkeypatch.setattr(chunked_upload, '_last_cleanup', 0)
+    assert client.get(f'/upload/{upload_id}').status_code == 200
+    assert not os.path.exists(stale_dir)
+
+
+def test_open_uploads_are_capped(client, font_data, monkeypatch):
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_MAX_OPEN', 2)
+    init_upload(client, font_data)
+    init_upload(client, font_data)
+    response = client.post('/upload/init', json={
+        'filename': 'sample.ttf', 'size': len(font_data), 'chunk_size': CHUNK_SIZE})
+    assert response.status_code == 503
+
+
+def test_open_upload_bytes_are_capped(client, font_data, monkeypatch):
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_MAX_TOTAL_BYTES', len(font_data) * 2)
+    init_upload(client, font_data)
+    init_upload(client, font_data)
+    response = client.post('/upload/init', json={
+        'filename': 'sample.ttf', 'size': len(font_data), 'chunk_size': CHUNK_SIZE})
+    assert response.status_code == 503
+
+    # 过期的上传被清理后可以继续创建
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_EXPIRE_SECONDS', -1)
+    init_upload(client, font_data)
+
+
+def test_upload_init_has_its_own_rate_limit(client):
+    from app import limiter
+
+    try:
+        # 超过页面默认的每小时 50 次，批量上传仍可进行
+        statuses = [client.post('/upload/init', json={'filename': 'a.txt'}).status_code
+                    for _ in range(60)]
+        assert 429 not in statuses
+
+        statuses = [client.post('/upload/init', json={'filename': 'a.txt'}).status_code
+                    for _ in range(150)]
+        assert 429 in statuses
+    finally:
+        limiter.reset()
+
+
+def test_upload_status_and_finalize_are_not_rate_limited(client):
+    from app import limiter
+
+    try:
+        for _ in range(60):
+            assert client.get('/upload/0123456789abcdef0123456789abcdef').status_code == 404
+            assert client.post('/upload/0123456789abcdef0123456789abcdef/finalize').status_code == 404
+    finally:
+        limiter.reset()
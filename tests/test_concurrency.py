@@ -0,0 +1,205 @@
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import font_executor
+import profiling
+from warmup import build_sample_font
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def font_path(tmp_path):
+    return build_sample_font(str(tmp_path / 'sample.ttf'))
+
+
+def test_run_font_job_inline(font_path, monkeypatch):
+    monkeypatch.delenv('TYPETRIM_EXECUTOR', raising=False)
+    result = font_executor.run_font_job(profiling.profiled_process_font_file, font_path, {'latin': True})
+    assert os.path.exists(result['output_path'])
+    os.unlink(result['output_path'])
+
+
+def fonttools_loaded():
+    return 'fontTools.subset' in sys.modules
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv('TYPETRIM_EXECUTOR', 'process')
+    yield font_executor.start_executor(1)
+    font_executor.shutdown_executor()
+
+
+def test_run_font_job_in_process_pool(font_path, pool):
+    result = font_executor.run_font_job(
+        profiling.profiled_process_font_file, font_path, {'latin': True}, request_id='pool-job')
+    assert os.path.exists(result['output_path'])
+    os.unlink(result['output_path'])
+
+    # 处理错误会原样传回
+    with pytest.raises(Exception):
+        font_executor.run_font_job(profiling.profiled_process_font_file, font_path, {})
+
+
+def test_pool_processes_start_eagerly_and_inherit_imports(pool):
+    # 子进程在 start_executor 中就已启动，并且 fork 自当前进程，无需重新导入 fontTools
+    assert len(pool._processes) == 1
+    assert font_executor.run_font_job(fonttools_loaded) is True
+
+
+def test_queued_time_does_not_count_towards_job_timeout(pool, monkeypatch):
+    monkeypatch.setenv('TYPETRIM_JOB_TIMEOUT', '1')
+    # 只有 1 个子进程：第二个任务排队 0.7 秒后才开始执行，总耗时超过 1 秒但执行时间没有
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        results = list(threads.map(lambda _: font_executor.run_font_job(time.sleep, 0.7), range(2)))
+    assert results == [None, None]
+
+
+def test_job_timeout_only_interrupts_the_stuck_job(pool, monkeypatch):
+    monkeypatch.setenv('TYPETRIM_JOB_TIMEOUT', '0.5')
+    pid = font_executor.run_font_job(os.getpid)
+
+    start = time.perf_counter()
+    with pytest.raises(Exception, match='超时'):
+        font_executor.run_font_job(time.sleep, 30)
+    assert time.perf_counter() - start < 5
+
+    # 子进程没有被终止，进程池也没有重建
+    assert font_executor.start_executor() is pool
+    assert font_executor.run_font_job(os.getpid) == pid
+
+
+def ignore_timeout_and_hang():
+    """模拟卡在不响应信号的代码中"""
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(30)
+
+
+def test_job_ignoring_timeout_is_killed_by_watchdog(pool, monkeypatch):
+    monkeypatch.setenv('TYPETRIM_JOB_TIMEOUT', '0.5')
+    monkeypatch.setattr(font_executor, 'HARD_TIMEOUT_GRACE', 0.5)
+    pid = font_executor.run_font_job(os.getpid)
+
+    start = time.perf_counter()
+    with pytest.raises(Exception, match='异常退出'):
+        font_executor.run_font_job(ignore_timeout_and_hang)
+    assert time.perf_counter() - start < 10
+
+    # 进程池已重建，后续任务正常执行
+    assert font_executor.run_font_job(os.getpid) != pid
+
+
+# 与 concurrent 模式下的 worker 相同：font_executor 在 gevent patch 之前导入（preload），
+# 因此 _executor_lock 是原生锁
+GEVENT_REBUILD_SCRIPT = r'''
+import os
+os.environ['TYPETRIM_EXECUTOR'] = 'process'
+import font_executor
+from gevent import monkey
+monkey.patch_all()
+import gevent
+
+broken = font_executor.start_executor(1)
+
+def rebuild_and_run():
+    font_executor._reset_executor(broken)
+    return font_executor.run_font_job(os.getpid)
+
+greenlets = [gevent.spawn(rebuild_and_run) for _ in range(2)]
+gevent.joinall(greenlets, timeout=30, raise_error=True)
+assert all(g.successful() for g in greenlets)
+print(len(font_executor.start_executor()._processes))
+font_executor.shutdown_executor()
+'''
+
+
+def test_concurrent_rebuild_under_gevent_does_not_deadlock():
+    pytest.importorskip('gevent')
+    try:
+        output = subprocess.run([sys.executable, '-c', GEVENT_REBUILD_SCRIPT], cwd=ROOT,
+                                check=True, capture_output=True, text=True, timeout=60).stdout
+    except subprocess.TimeoutExpired:
+        pytest.fail('两个协程同时重建进程池时 worker 卡死')
+    # 只保留了一个进程池
+    assert output.strip().splitlines()[-1] == '1'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path):
+    """以 concurrent 模式启动 gunicorn：1 个 gevent worker"""
+    pytest.importorskip('gunicorn')
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY='1',
+               TYPETRIM_SERVER_MODE='concurrent', TYPETRIM_CPU_WORKERS='1', GUNICORN_LOG_LEVEL='warning')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.kill()
+                pytest.fail('gunicorn 启动失败')
+            time.sleep(0.2)
+
+    yield port
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def open_slow_upload(port):
+    """模拟慢速客户端：声明 1MB 的请求体，只发送开头几个字节"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(
+        b'POST /process HTTP/1.1\r\nHost: localhost\r\n'
+        b'Content-Type: multipart/form-data; boundary=x\r\n'
+        b'Content-Length: 1048576\r\n\r\n--x\r\n')
+    return sock
+
+
+def test_slow_clients_do_not_block_fast_ones(server, font_path):
+    # 慢速客户端数量远多于 CPU 进程数，每个连接都只是一个等待中的协程
+    slow_clients = [open_slow_upload(server) for _ in range(50)]
+    try:
+        time.sleep(0.5)
+
+        connection = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+        start = time.perf_counter()
+        connection.request('GET', '/')
+        assert connection.getresponse().status == 200
+        assert time.perf_counter() - start < 5
+
+        # 字体处理在进程池中完成，同样不受慢速客户端影响
+        with open(font_path, 'rb') as f:
+            font_data = f.read()
+        body = (b'--x\r\nContent-Disposition: form-data; name="font"; filename="sample.ttf"\r\n'
+                b'Content-Type: font/ttf\r\n\r\n' + font_data +
+                b'\r\n--x\r\nContent-Disposition: form-data; name="options"\r\n\r\n{"latin": true}\r\n--x--\r\n')
+        connection = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+        connection.request('POST', '/process', body=body,
+                           headers={'Content-Type': 'multipart/form-data; boundary=x'})
+        response = connection.getresponse()
+        assert response.status == 200
+        assert b'download_url' in response.read()
+    finally:
+        for sock in slow_clients:
+            sock.close()
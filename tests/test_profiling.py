@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import profiling
+from warmup import build_sample_font
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return {
+        'admin_token': 'secret',
+        'sample_rate': 0,
+        'slow_threshold': 30,
+        'profile_dir': str(tmp_path / 'profiles'),
+        'max_artifacts': 2,
+        'top_allocations': 5,
+    }
+
+
+@pytest.fixture
+def font_path(tmp_path):
+    return build_sample_font(str(tmp_path / 'sample.ttf'))
+
+
+def test_requested_profile_saves_artifacts(font_path, settings):
+    result = profiling.profiled_process_font_file(
+        font_path, {'latin': True}, request_id='req-1', profile=True, settings=settings)
+    os.unlink(result['output_path'])
+
+    paths = profiling.artifact_paths('req-1', settings)
+    assert set(paths) == {'json', 'prof'}
+
+    profiles = profiling.list_profiles(settings)
+    assert profiles[0]['request_id'] == 'req-1'
+    assert profiles[0]['reason'] == 'requested'
+
+    table_sizes = profiling.get_font_table_sizes(font_path)
+    assert 'glyf' in table_sizes and 'cmap' in table_sizes
+
+
+def test_fast_job_without_profiling_saves_nothing(font_path, settings):
+    result = profiling.profiled_process_font_file(
+        font_path, {'latin': True}, request_id='req-2', settings=settings)
+    os.unlink(result['output_path'])
+    assert profiling.list_profiles(settings) == []
+
+
+def test_slow_job_is_captured(font_path, settings):
+    settings['slow_threshold'] = 1e-9
+    result = profiling.profiled_process_font_file(
+        font_path, {'latin': True}, request_id='req-3', settings=settings)
+    os.unlink(result['output_path'])
+
+    paths = profiling.artifact_paths('req-3', settings)
+    assert set(paths) == {'json', 'stacks'}
+    assert profiling.list_profiles(settings)[0]['reason'] == 'slow'
+
+
+def test_old_artifacts_are_pruned(font_path, settings):
+    settings['slow_threshold'] = 1e-9
+    for i in range(3):
+        result = profiling.profiled_process_font_file(
+            font_path, {'latin': True}, request_id=f'req-{i}', settings=settings)
+        os.unlink(result['output_path'])
+    assert len(profiling.list_profiles(settings)) == 2
+
+
+def test_should_profile_and_request_id_validation(settings):
+    assert profiling.should_profile({'X-Profile-Token': 'secret'}, settings)
+    assert not profiling.should_profile({'X-Profile-Token': 'wrong'}, settings)
+    settings['admin_token'] = ''
+    assert not profiling.should_profile({'X-Profile-Token': ''}, settings)
+
+    assert profiling.is_valid_request_id('abc-123_x')
+    assert not profiling.is_valid_request_id('../etc/passwd')
+    assert profiling.artifact_paths('../x', settings) == {}
+
+
+def test_client_request_id_is_not_used_as_artifact_key(tmp_path, monkeypatch):
+    from app import app
+
+    monkeypatch.setenv('PROFILE_ADMIN_TOKEN', 'secret')
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+    font_path = build_sample_font(str(tmp_path / 'sample.ttf'))
+
+    responses = []
+    for _ in range(2):
+        with open(font_path, 'rb') as f:
+            response = app.test_client().post('/process', data={
+                'font': (f, 'sample.ttf'), 'options': '{"latin": true}',
+            }, headers={'X-Request-ID': 'victim', 'X-Profile-Token': 'secret'})
+        assert response.status_code == 200
+        os.unlink(response.get_json()['output_path'])
+        responses.append(response)
+
+    # 每次请求都有各自由服务端生成的请求 ID，同一个客户端 ID 不会互相覆盖
+    request_ids = [r.headers['X-Request-ID'] for r in responses]
+    assert 'victim' not in request_ids and request_ids[0] != request_ids[1]
+    assert profiling.artifact_paths('victim') == {}
+
+    profiles = profiling.list_profiles()
+    assert sorted(p['request_id'] for p in profiles) == sorted(request_ids)
+    assert all(p['client_request_id'] == 'victim' for p in profiles)
+
+
+# 在 gevent patch 之后的进程中运行采样器（与 concurrent 模式下的 worker 及其进程池子进程相同）
+GEVENT_SAMPLER_SCRIPT = r'''
+from gevent import monkey
+monkey.patch_all()
+import time
+import profiling
+
+sampler = profiling.StackSampler()
+sampler.start()
+deadline = time.perf_counter() + 0.5
+while time.perf_counter() < deadline:
+    sum(range(1000))
+sampler.stop()
+print(sum(sampler.stacks.values()))
+'''
+
+
+def test_stack_sampler_works_with_gevent_patched():
+    pytest.importorskip('gevent')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', GEVENT_SAMPLER_SCRIPT], cwd=root,
+                            check=True, capture_output=True, text=True, timeout=60).stdout
+    assert int(output.strip().splitlines()[-1]) > 0
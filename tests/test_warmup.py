@@ -0,0 +1,54 @@
+import logging
+import os
+import tempfile
+
+import pytest
+
+import typetrim
+from warmup import warm_up
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    # 让预热过程中创建的临时文件都落在单独的目录里，便于检查是否清理干净
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+def test_warm_up_returns_duration_and_cleans_up(temp_dir):
+    elapsed = warm_up()
+    assert isinstance(elapsed, float) and elapsed > 0
+    assert os.listdir(temp_dir) == []
+
+
+def test_warm_up_logs_instead_of_raising(temp_dir, monkeypatch, caplog):
+    def broken(input_path, options=None):
+        raise Exception('boom')
+
+    monkeypatch.setattr(typetrim, 'process_font_file', broken)
+    with caplog.at_level(logging.WARNING):
+        elapsed = warm_up()
+
+    assert elapsed >= 0
+    assert 'fontTools 预热失败: boom' in caplog.text
+    assert os.listdir(temp_dir) == []
+
+
+def test_gunicorn_when_ready_warms_up_and_freezes(monkeypatch):
+    import gc
+    import runpy
+    from unittest import mock
+
+    import warmup
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = runpy.run_path(os.path.join(root, 'gunicorn.conf.py'))
+    monkeypatch.setattr(warmup, 'warm_up', mock.Mock(return_value=0.01))
+    monkeypatch.setattr(gc, 'freeze', mock.Mock())
+    server = mock.Mock()
+
+    config['when_ready'](server)
+
+    warmup.warm_up.assert_called_once_with()
+    gc.freeze.assert_called_once_with()
+    assert '预热完成' in server.log.info.call_args[0][0]
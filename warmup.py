@@ -0,0 +1,68 @@
+"""
+TrimType 启动预热
+-----------------------------------
+fontTools 的很多模块和表类是在第一次用到时才导入/注册的，
+导致每个 worker 的第一次 /process 明显偏慢。
+
+这里用一个内置生成的极小字体完整跑一遍 process_font_file，
+在 gunicorn master 中 fork 之前调用（见 gunicorn.conf.py），
+预热后的模块由各个 worker 以写时复制的方式共享。
+"""
+
+import logging
+import os
+import string
+import tempfile
+import time
+
+
+def build_sample_font(path):
+    """生成一个包含可打印 ASCII 字符的小型 TrueType 字体，保存到 path"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    pen = TTGlyphPen(None)
+    pen.moveTo((100, 0))
+    pen.lineTo((300, 700))
+    pen.lineTo((500, 0))
+    pen.closePath()
+    outline = pen.glyph()
+
+    chars = string.ascii_letters + string.digits + string.punctuation
+    glyph_names = {ord(c): f"uni{ord(c):04X}" for c in chars}
+    glyph_order = ['.notdef', 'space'] + list(glyph_names.values())
+
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({0x20: 'space', **glyph_names})
+    glyphs = {name: outline for name in glyph_order}
+    glyphs['space'] = TTGlyphPen(None).glyph()
+    fb.setupGlyf(glyphs)
+    fb.setupHorizontalMetrics({name: (600, 100) for name in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({'familyName': 'TrimType Warmup', 'styleName': 'Regular'})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(path)
+    return path
+
+
+def warm_up():
+    """用内置字体跑一遍完整的裁剪流程，返回耗时（秒）；预热失败不影响启动"""
+    from typetrim import process_font_file
+
+    start = time.perf_counter()
+    fd, input_path = tempfile.mkstemp(suffix='.ttf')
+    os.close(fd)
+    try:
+        build_sample_font(input_path)
+        result = process_font_file(input_path, {'latin': True, 'numbers': True, 'en_punctuation': True})
+        os.unlink(result['output_path'])
+    except Exception as e:
+        logging.warning(f"fontTools 预热失败: {e}")
+    finally:
+        try:
+            os.unlink(input_path)
+        except OSError:
+            pass
+    return time.perf_counter() - start